@@ -19,15 +19,17 @@ logging.getLogger("app.monitoring.voice_detector").setLevel(logging.WARNING)
 from fastapi import FastAPI, Depends, Body
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import UploadFile, File, HTTPException, Form
+from fastapi.responses import Response
 import numpy as np
 import cv2
-from typing import Optional
+from typing import Any, Coroutine, Optional, Tuple
 import httpx
+import orjson
 
-from .monitoring.face_detector import FaceDetector
+from .monitoring.face_detector import FaceDetector, FaceResult
 from .monitoring.eye_tracker import EyeTracker
 from .monitoring.voice_detector import VoiceDetector
-from .session import SessionManager
+from .session import FrameState, SessionManager
 from .auth import require_bearer_auth, require_session_id
 from .models.schemas import ViolationType
 
@@ -44,78 +46,175 @@ app.add_middleware(
 
 
 # Global singletons (kept warm)
-detectors: Dict[str, object] = {}
+face_detector: Optional[FaceDetector] = None
+eye_tracker: Optional[EyeTracker] = None
+voice_detector: Optional[VoiceDetector] = None
 session_manager = SessionManager()
 
 # Backend API URL
 BACKEND_API_URL = os.getenv("BACKEND_API_URL", "http://localhost:8080")
+_VIOLATION_LOG_URL = f"{BACKEND_API_URL}/api/violation/log"
 
-# Track last violation sent to avoid spam
-_last_violation_sent: Dict[str, float] = {}
+# Backend expects upper-case violation names; computed once instead of per send
+_VIOLATION_TYPE_NAMES: Dict[ViolationType, str] = {vt: vt.value.upper() for vt in ViolationType}
+
+# Track last violation sent to avoid spam, keyed by (exam_id, student_id, violation_type)
+_last_violation_sent: Dict[Tuple[int, int, ViolationType], float] = {}
 VIOLATION_COOLDOWN_SECONDS = 5.0  # Don't send same violation type more than once per 5 seconds
+MAX_CONCURRENT_VIOLATION_SENDS = 16  # Caps in-flight backend requests when the backend is slow or down
+
+# JPEG frames are decoded at 1/N resolution (libjpeg scales during the IDCT, so this is cheaper than a full decode).
+# FaceMesh landmarks are normalized, so gaze ratios do not depend on the resolution; face boxes are scaled back.
+FRAME_DECODE_SCALE = int(os.getenv("FRAME_DECODE_SCALE", "2"))
+_REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+if FRAME_DECODE_SCALE not in _REDUCED_DECODE_FLAGS:
+    raise ValueError(f"FRAME_DECODE_SCALE must be one of {sorted(_REDUCED_DECODE_FLAGS)}, got {FRAME_DECODE_SCALE}")
+
+# Expired sessions (and their audio buffers / frame state) are swept this often
+SESSION_CLEANUP_INTERVAL_SECONDS = 60.0
+
+# Audio uploads are buffered per session and analysed in windows of this many 30 ms VAD frames (300 ms)
+AUDIO_WINDOW_FRAMES = 10
 
 
 @app.on_event("startup")
 def on_startup() -> None:
+    global face_detector, eye_tracker, voice_detector
     # Initialize detectors once
-    detectors["face"] = FaceDetector()
-    detectors["eye"] = EyeTracker()
-    detectors["voice"] = VoiceDetector()
+    face_detector = FaceDetector()
+    eye_tracker = EyeTracker()
+    voice_detector = VoiceDetector()
+    # One pooled client for all violation sends so keep-alive connections to the backend are reused
+    app.state.http = httpx.AsyncClient(
+        timeout=5.0,
+        limits=httpx.Limits(max_keepalive_connections=20),
+    )
+    app.state.violation_sem = asyncio.Semaphore(MAX_CONCURRENT_VIOLATION_SENDS)
+    # Strong references to background sends; also lets shutdown wait for them
+    app.state.pending_violations = set()
+
+
+async def _sweep_sessions() -> None:
+    """Periodically drop expired and stopped sessions; cleanup only looks at sessions that are due."""
+    while True:
+        await asyncio.sleep(SESSION_CLEANUP_INTERVAL_SECONDS)
+        removed = session_manager.cleanup()
+        if removed:
+            logging.info("Session sweep: removed %d expired/stopped sessions", removed)
+
+
+@app.on_event("startup")
+async def start_session_sweep() -> None:
+    app.state.session_sweep = asyncio.create_task(_sweep_sessions())
 
 
 @app.on_event("shutdown")
-def on_shutdown() -> None:
+async def on_shutdown() -> None:
+    global face_detector, eye_tracker, voice_detector
+    sweep: Optional[asyncio.Task] = getattr(app.state, "session_sweep", None)
+    if sweep is not None:
+        sweep.cancel()
     # Release detector resources
-    face: FaceDetector = detectors.get("face")  # type: ignore
-    if face:
-        face.release()
-    eye: EyeTracker = detectors.get("eye")  # type: ignore
-    if eye:
-        eye.release()
-    voice: VoiceDetector = detectors.get("voice")  # type: ignore
-    if voice:
-        voice.release()
+    if face_detector:
+        face_detector.release()
+        face_detector = None
+    if eye_tracker:
+        eye_tracker.release()
+        eye_tracker = None
+    if voice_detector:
+        voice_detector.release()
+        voice_detector = None
+    pending = getattr(app.state, "pending_violations", None)
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+    http: Optional[httpx.AsyncClient] = getattr(app.state, "http", None)
+    if http is not None:
+        await http.aclose()
     session_manager.cleanup()
 
 
+def _json_response(content: Dict[str, Any]) -> Response:
+    """Serialize a hot-path response with orjson, bypassing jsonable_encoder and the stdlib json encoder."""
+    return Response(
+        content=orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY),
+        media_type="application/json",
+    )
+
+
 @app.get("/health")
 def health() -> Dict[str, str]:
     return {"status": "ok"}
 
 
-async def send_violation_to_backend(exam_id: int, student_id: int, violation_type: ViolationType, message: str, session_id: str):
-    """Send violation to backend API asynchronously"""
+def should_send_violation(exam_id: int, student_id: int, violation_type: ViolationType) -> Optional[float]:
+    """Claim the cooldown slot for a violation and return the claim's timestamp; None while the
+    previous send is still cooling down.
+
+    Only called from the event loop, so the check-and-set cannot interleave with another request.
+    """
+    violation_key = (exam_id, student_id, violation_type)
+    current_time = time.time()
+    last_sent = _last_violation_sent.get(violation_key)
+    if last_sent is not None and current_time - last_sent < VIOLATION_COOLDOWN_SECONDS:
+        return None
+    _last_violation_sent[violation_key] = current_time
+    return current_time
+
+
+async def send_violation_to_backend(
+    exam_id: int,
+    student_id: int,
+    violation_type: ViolationType,
+    message: str,
+    session_id: str,
+    claimed_at: float,
+):
+    """Send violation to backend API asynchronously (claimed_at is the timestamp from should_send_violation)"""
+    violation_key = (exam_id, student_id, violation_type)
     try:
-        violation_key = f"{exam_id}_{student_id}_{violation_type.value}"
-        current_time = time.time()
-        
-        # Check cooldown
-        if violation_key in _last_violation_sent:
-            time_since_last = current_time - _last_violation_sent[violation_key]
-            if time_since_last < VIOLATION_COOLDOWN_SECONDS:
-                return  # Skip if within cooldown period
-        
-        url = f"{BACKEND_API_URL}/api/violation/log"
+        url = _VIOLATION_LOG_URL
         payload = {
             "examId": exam_id,
             "studentId": student_id,
-            "violationType": violation_type.value.upper(),
+            "violationType": _VIOLATION_TYPE_NAMES[violation_type],
             "message": message,
             "sessionId": session_id
         }
         
         # Log the data being sent to backend
-        logging.info(f"Sending violation to backend - URL: {url}, Payload: {payload}")
+        logging.info("Sending violation to backend - URL: %s, Payload: %s", url, payload)
         
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.post(url, json=payload)
-            if response.status_code == 200:
-                logging.info(f"Violation sent successfully to backend: {violation_type.value}, Response: {response.text}")
-                _last_violation_sent[violation_key] = current_time
-            else:
-                logging.warning(f"Failed to send violation to backend: Status={response.status_code}, Response={response.text}, Payload={payload}")
+        client: httpx.AsyncClient = app.state.http
+        response = await client.post(url, json=payload)
+        if response.status_code == 200:
+            logging.info("Violation sent successfully to backend: %s, Response: %s", violation_type.value, response.text)
+            return
+        logging.warning(
+            "Failed to send violation to backend: Status=%s, Response=%s, Payload=%s",
+            response.status_code, response.text, payload,
+        )
     except Exception as e:
-        logging.error(f"Error sending violation to backend: {e}")
+        logging.error("Error sending violation to backend: %s", e)
+    # Failed: release the cooldown slot so the next detection retries, unless a newer send
+    # has claimed it in the meantime (this one may have waited on the semaphore and the timeout)
+    if _last_violation_sent.get(violation_key) == claimed_at:
+        del _last_violation_sent[violation_key]
+
+
+def _spawn_violation_send(send: Coroutine[Any, Any, None]) -> None:
+    """Run a violation send in the background, at most MAX_CONCURRENT_VIOLATION_SENDS at a time."""
+    async def _run() -> None:
+        async with app.state.violation_sem:
+            await send
+
+    task = asyncio.create_task(_run())
+    app.state.pending_violations.add(task)
+    task.add_done_callback(app.state.pending_violations.discard)
 
 
 @app.post("/api/anti-cheat/session/start")
@@ -134,6 +233,51 @@ def stop_session(sessionId: str, _=Depends(require_bearer_auth)) -> Dict[str, bo
     ok = session_manager.stop(sessionId)
     return {"stopped": ok}
 
+
+def _analyze_sync(
+    image_bytes: bytes, content_type: str, frame_state: FrameState, frame_index: int
+) -> Tuple[bool, Optional[FaceResult], bool, Optional[str]]:
+    """Decode an uploaded frame and run face/eye detection (blocking, runs in a worker thread).
+
+    frame_index/frame_state are the uploading session's own: detector strides count that session's frames only.
+    """
+    # Reduced decoding only pays off for JPEG; PNG would be decoded in full and then resized
+    scale = FRAME_DECODE_SCALE if content_type == "image/jpeg" else 1
+    np_arr = np.frombuffer(image_bytes, np.uint8)
+    frame = cv2.imdecode(np_arr, _REDUCED_DECODE_FLAGS[scale])
+    if frame is None:
+        raise HTTPException(status_code=400, detail="Invalid image data")
+    # The decoded buffer is ours: swap channels in place once instead of letting each detector copy it
+    cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame)
+
+    face = face_detector
+    eye = eye_tracker
+    if face is None or eye is None:
+        # Detectors are created on startup and released on shutdown
+        raise HTTPException(status_code=503, detail="Detectors are not available")
+
+    cached = frame_state.last_face
+    if frame_index % face.frame_stride and cached is not None and cached[0] == frame.shape:
+        # Skipped frame: repeat this session's last result (same decoded size, so the box still fits)
+        _, face_present, face_data = cached
+    else:
+        face_present, face_data = face.detect_face(frame, is_rgb=True)
+        frame_state.last_face = (frame.shape, face_present, face_data)
+    # Gaze tracking reuses the face result: skipped without a face, cropped to the face box otherwise
+    looking_away, message = eye.is_looking_away(
+        frame, is_rgb=True, face_present=face_present, face_bbox=face_data, frame_index=frame_index
+    )
+    if face_data is not None and scale != 1:
+        # Report the face box in the coordinates of the uploaded image
+        face_data = face_data._replace(
+            x=face_data.x * scale,
+            y=face_data.y * scale,
+            width=face_data.width * scale,
+            height=face_data.height * scale,
+        )
+    return face_present, face_data, looking_away, message
+
+
 @app.post("/api/anti-cheat/frame")
 async def analyze_frame(
     file: UploadFile = File(...),
@@ -144,59 +288,73 @@ async def analyze_frame(
         raise HTTPException(status_code=400, detail="Unsupported image type")
 
     session_manager.touch(x_session_id)
+    frame_state = session_manager.frame_state(x_session_id)
+    # Counted on the event loop, so concurrent uploads of one session still get distinct indices
+    frame_index = frame_state.next_frame_index()
 
     # Read image bytes
     image_bytes = await file.read()
-    np_arr = np.frombuffer(image_bytes, np.uint8)
-    frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-    if frame is None:
-        raise HTTPException(status_code=400, detail="Invalid image data")
-
-    face: FaceDetector = detectors["face"]  # type: ignore
-    eye: EyeTracker = detectors["eye"]  # type: ignore
+    # Decode + detection are CPU-bound; run them in a worker thread so the event loop keeps serving other sessions
+    face_present, face_data, looking_away, message = await asyncio.to_thread(
+        _analyze_sync, image_bytes, file.content_type, frame_state, frame_index
+    )
 
     alerts = []
     metrics: Dict[str, float | bool] = {}
-    face_present, face_data = face.detect_face(frame)
 
-    if not face_present:
+    if not face_present or face_data is None:
         alerts.append("no_face")
     else:
-        metrics["faceConfidence"] = float(face_data["confidence"])
+        metrics["faceConfidence"] = face_data.confidence
 
-    looking_away, message = eye.is_looking_away(frame)
     if looking_away:
         alerts.append("looking_away")
         # Send violation to backend
         session_info = session_manager.get(x_session_id)
-        if session_info and session_info.exam_id and session_info.student_id:
-            asyncio.create_task(send_violation_to_backend(
+        if (
+            session_info
+            and session_info.exam_id
+            and session_info.student_id
+            and (
+                claimed_at := should_send_violation(session_info.exam_id, session_info.student_id, ViolationType.EYE_GAZE)
+            ) is not None
+        ):
+            _spawn_violation_send(send_violation_to_backend(
                 exam_id=session_info.exam_id,
                 student_id=session_info.student_id,
                 violation_type=ViolationType.EYE_GAZE,
                 message=message or "Student looking away detected",
-                session_id=x_session_id
+                session_id=x_session_id,
+                claimed_at=claimed_at,
             ))
 
     # Check for face presence violation
     if not face_present:
         session_info = session_manager.get(x_session_id)
-        if session_info and session_info.exam_id and session_info.student_id:
-            asyncio.create_task(send_violation_to_backend(
+        if (
+            session_info
+            and session_info.exam_id
+            and session_info.student_id
+            and (
+                claimed_at := should_send_violation(session_info.exam_id, session_info.student_id, ViolationType.FACE_PRESENCE)
+            ) is not None
+        ):
+            _spawn_violation_send(send_violation_to_backend(
                 exam_id=session_info.exam_id,
                 student_id=session_info.student_id,
                 violation_type=ViolationType.FACE_PRESENCE,
                 message="Student face not detected",
-                session_id=x_session_id
+                session_id=x_session_id,
+                claimed_at=claimed_at,
             ))
 
     response = {
         "alerts": alerts,
-        "face": face_data if face_present else None,
+        "face": face_data._asdict() if face_present and face_data is not None else None,
         "metrics": metrics,
         "message": message if looking_away else None,
     }
-    return response
+    return _json_response(response)
 
 
 @app.post("/api/anti-cheat/audio")
@@ -212,24 +370,40 @@ async def analyze_audio(
         raise HTTPException(status_code=400, detail="Unsupported audio type; expected raw PCM16 mono 16k")
 
     audio_bytes = await file.read()
-    voice: VoiceDetector = detectors["voice"]  # type: ignore
-    is_speech = voice.process_audio_frame(audio_bytes)
+    voice = voice_detector
+    if voice is None:
+        # Detectors are created on startup and released on shutdown
+        raise HTTPException(status_code=503, detail="Detectors are not available")
+    # Small uploads are accumulated until a full window is available; until then the
+    # detector only reports its recent speech state (process_audio_frame on short input)
+    window = session_manager.buffer_audio(
+        x_session_id, audio_bytes, voice.frame_size * 2 * AUDIO_WINDOW_FRAMES
+    )
+    is_speech = voice.process_audio_frame(window)
 
     alerts = []
     if is_speech:
         alerts.append("speech_detected")
         # Send violation to backend
         session_info = session_manager.get(x_session_id)
-        if session_info and session_info.exam_id and session_info.student_id:
-            asyncio.create_task(send_violation_to_backend(
+        if (
+            session_info
+            and session_info.exam_id
+            and session_info.student_id
+            and (
+                claimed_at := should_send_violation(session_info.exam_id, session_info.student_id, ViolationType.VOICE)
+            ) is not None
+        ):
+            _spawn_violation_send(send_violation_to_backend(
                 exam_id=session_info.exam_id,
                 student_id=session_info.student_id,
                 violation_type=ViolationType.VOICE,
                 message="Human speech detected",
-                session_id=x_session_id
+                session_id=x_session_id,
+                claimed_at=claimed_at,
             ))
 
-    return {
+    return _json_response({
         "alerts": alerts,
         "metrics": {"speech": is_speech},
-    }
+    })
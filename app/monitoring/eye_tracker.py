@@ -1,4 +1,7 @@
 import logging
+import math
+import os
+import threading
 import time
 from collections import deque
 from typing import Optional, Tuple
@@ -8,9 +11,46 @@ import mediapipe as mp
 import numpy as np
 from mediapipe.framework.formats import landmark_pb2
 
+from .face_detector import FaceResult
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional; the gaze kernel then runs as plain Python
+    njit = None
+
 logger = logging.getLogger(__name__)
 
 
+def _ratio_between(corner_a: float, corner_b: float, iris_center_x: float, flip_horizontal: bool) -> float:
+    """Position of the iris between the two eye corners in [0, 1], or -1.0 if the corners coincide."""
+    min_corner = min(corner_a, corner_b)
+    max_corner = max(corner_a, corner_b)
+    denominator = max_corner - min_corner
+    if denominator <= 1e-6:
+        return -1.0
+
+    ratio = (iris_center_x - min_corner) / denominator
+    if flip_horizontal:
+        ratio = 1.0 - ratio
+    return min(max(ratio, 0.0), 1.0)
+
+
+def _eye_ratios(gaze_x) -> Tuple[float, float]:
+    """Left/right eye ratios from the 12 x-coordinates laid out as EyeTracker.GAZE_LANDMARK_INDICES."""
+    left = _ratio_between(
+        gaze_x[0], gaze_x[1], (gaze_x[2] + gaze_x[3] + gaze_x[4] + gaze_x[5]) * 0.25, False
+    )
+    right = _ratio_between(
+        gaze_x[6], gaze_x[7], (gaze_x[8] + gaze_x[9] + gaze_x[10] + gaze_x[11]) * 0.25, True
+    )
+    return left, right
+
+
+if njit is not None:
+    _ratio_between = njit(cache=True, fastmath=True)(_ratio_between)
+    _eye_ratios = njit(cache=True, fastmath=True)(_eye_ratios)
+
+
 class EyeTracker:
     LEFT_EYE_CORNER_INDICES = (33, 133)         #góc mắt trái
     LEFT_IRIS_INDICES = (468, 469, 470, 471)    #điểm landmark con ngươi
@@ -18,6 +58,14 @@ class EyeTracker:
     RIGHT_EYE_CORNER_INDICES = (362, 263)        #góc mắt phải
     RIGHT_IRIS_INDICES = (473, 474, 475, 476)    #điểm landmark con ngươi
 
+    # Landmarks read per frame, gathered into one array: [corner, corner, iris x4] for the left then the right eye
+    GAZE_LANDMARK_INDICES = (
+        LEFT_EYE_CORNER_INDICES + LEFT_IRIS_INDICES + RIGHT_EYE_CORNER_INDICES + RIGHT_IRIS_INDICES
+    )
+
+    # Margin added on each side of the face box before cropping, as a fraction of the box size
+    FACE_CROP_PADDING = 0.5
+
     #khởi tạo và thiết lập tham số
     def __init__(self, predictor_path: Optional[str] = None):
         if predictor_path:
@@ -33,70 +81,127 @@ class EyeTracker:
             min_tracking_confidence=0.5, 
         )
 
-        self.CONSECUTIVE_LOOK_AWAY_FRAMES = 5
+        # Run FaceMesh on every N-th frame of a session only; gaze does not change faster than ~100 ms
+        self.frame_stride = max(1, int(os.getenv("EYE_TRACKER_STRIDE", "2")))
+        # Confirmation window of ~5 incoming frames, counted in processed frames
+        self.CONSECUTIVE_LOOK_AWAY_FRAMES = max(1, math.ceil(5 / self.frame_stride))
         self.GAZE_MIN_THRESHOLD = 0.4 
         self.GAZE_MAX_THRESHOLD = 0.6 
 
         self.consecutive_look_away_count = 0 
 
+        # FaceMesh is not thread-safe and the look-away counter is shared state
+        self._lock = threading.Lock()
+        # Reused RGB buffer for BGR callers (only touched while holding _lock)
+        self._rgb_buf: Optional[np.ndarray] = None
+
+        if njit is not None:
+            # Compile (or load the cached) gaze kernel now rather than on the first frame
+            _eye_ratios(np.zeros(len(self.GAZE_LANDMARK_INDICES)))
+
         logger.info("EyeTracker: using MediaPipe FaceMesh with iris landmarks") 
 
-    def _compute_eye_ratio(
-        self,
-        face_landmarks: landmark_pb2.NormalizedLandmarkList,
-        corner_indices: Tuple[int, int],
-        iris_indices: Tuple[int, int, int, int],
-        flip_horizontal: bool,
-    ) -> Optional[float]:
+    def _gather_gaze_x(
+        self, face_landmarks: landmark_pb2.NormalizedLandmarkList
+    ) -> Optional[np.ndarray]:
+        """Copy the x-coordinates of the gaze landmarks out of the protobuf in a single pass."""
         landmarks = face_landmarks.landmark
-
         try:
-            corners_x = [landmarks[idx].x for idx in corner_indices]
-            iris_points_x = [landmarks[idx].x for idx in iris_indices]
+            return np.fromiter(
+                (landmarks[idx].x for idx in self.GAZE_LANDMARK_INDICES),
+                dtype=np.float64,
+                count=len(self.GAZE_LANDMARK_INDICES),
+            )
         except IndexError:
             return None
 
-        if not iris_points_x:
-            return None
-
-        iris_center_x = float(np.mean(iris_points_x))
-        min_corner = float(np.min(corners_x))
-        max_corner = float(np.max(corners_x))
-        denominator = max_corner - min_corner
-        if denominator <= 1e-6:
-            return None
-
-        ratio = (iris_center_x - min_corner) / denominator
-        if flip_horizontal:
-            ratio = 1.0 - ratio
-        return float(np.clip(ratio, 0.0, 1.0))
-
-
-
+    def _compute_eye_ratio(
+        self,
+        landmarks,
+        c0: int,
+        c1: int,
+        i0: int,
+        i1: int,
+        i2: int,
+        i3: int,
+        flip_horizontal: bool,
+    ) -> float:
+        """Pure-Python path: read the six landmarks straight from the protobuf, no intermediate list or array."""
+        return _ratio_between(
+            landmarks[c0].x,
+            landmarks[c1].x,
+            (landmarks[i0].x + landmarks[i1].x + landmarks[i2].x + landmarks[i3].x) * 0.25,
+            flip_horizontal,
+        )
 
     #tính toán tỉ lệ iris trung bình 2 mắt
     def _get_iris_ratio(
         self, face_landmarks: landmark_pb2.NormalizedLandmarkList
     ) -> Optional[Tuple[float, float]]:
-        left_ratio = self._compute_eye_ratio(
-            face_landmarks,
-            self.LEFT_EYE_CORNER_INDICES,
-            self.LEFT_IRIS_INDICES,
-            flip_horizontal=False,
-        )
-        right_ratio = self._compute_eye_ratio(
-            face_landmarks,
-            self.RIGHT_EYE_CORNER_INDICES,
-            self.RIGHT_IRIS_INDICES,
-            flip_horizontal=True,
-        )
+        if njit is not None:
+            gaze_x = self._gather_gaze_x(face_landmarks)
+            if gaze_x is None:
+                return None
+            left_ratio, right_ratio = _eye_ratios(gaze_x)
+        else:
+            landmarks = face_landmarks.landmark
+            lc0, lc1, li0, li1, li2, li3, rc0, rc1, ri0, ri1, ri2, ri3 = self.GAZE_LANDMARK_INDICES
+            try:
+                left_ratio = self._compute_eye_ratio(landmarks, lc0, lc1, li0, li1, li2, li3, False)
+                right_ratio = self._compute_eye_ratio(landmarks, rc0, rc1, ri0, ri1, ri2, ri3, True)
+            except IndexError:
+                return None
 
-        if left_ratio is None or right_ratio is None:
+        if left_ratio < 0.0 or right_ratio < 0.0:
             return None
         return (left_ratio, right_ratio)
 
-    def is_looking_away(self, frame: np.ndarray) -> Tuple[bool, Optional[str]]:
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    def is_looking_away(
+        self,
+        frame: np.ndarray,
+        is_rgb: bool = False,
+        face_present: bool = True,
+        face_bbox: Optional[FaceResult] = None,
+        frame_index: int = 0,
+    ) -> Tuple[bool, Optional[str]]:
+        """
+        Pass is_rgb=True when the caller already holds an RGB frame to skip the color conversion.
+        face_present/face_bbox come from FaceDetector on the same frame: without a face FaceMesh is
+        skipped entirely, and with a box only the padded face region is passed to FaceMesh.
+        frame_index is the frame's position in its own session's stream; FaceMesh runs on every
+        frame_stride-th frame of each session.
+        """
+        with self._lock:
+            if not face_present:
+                self._reset_look_away_state()
+                return False, None
+            if frame_index % self.frame_stride:
+                # Skipped frame: a look-away is only reported on the processed frame that confirms it
+                return False, None
+            if face_bbox is not None:
+                # Gaze ratios use normalized landmarks, so they are the same on the cropped view
+                frame = self._crop_to_face(frame, face_bbox)
+            if is_rgb:
+                rgb_frame = frame
+            else:
+                if self._rgb_buf is None or self._rgb_buf.shape != frame.shape:
+                    self._rgb_buf = np.empty_like(frame)
+                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self._rgb_buf)
+            return self._process_rgb(rgb_frame)
+
+    def _crop_to_face(self, frame: np.ndarray, face_bbox: FaceResult) -> np.ndarray:
+        h, w = frame.shape[:2]
+        pad_x = int(face_bbox.width * self.FACE_CROP_PADDING)
+        pad_y = int(face_bbox.height * self.FACE_CROP_PADDING)
+        x0 = max(0, face_bbox.x - pad_x)
+        y0 = max(0, face_bbox.y - pad_y)
+        x1 = min(w, face_bbox.x + face_bbox.width + pad_x)
+        y1 = min(h, face_bbox.y + face_bbox.height + pad_y)
+        if x1 - x0 < 2 or y1 - y0 < 2:
+            return frame
+        return frame[y0:y1, x0:x1]
+
+    def _process_rgb(self, rgb_frame: np.ndarray) -> Tuple[bool, Optional[str]]:
         results = self.face_mesh.process(rgb_frame)
 
         if not results.multi_face_landmarks:
@@ -111,39 +216,46 @@ class EyeTracker:
             return False, None
 
         left_ratio, right_ratio = ratios
-        logger.info(f"left_ratio: {left_ratio}, right_ratio: {right_ratio}")
+        # Checked once per frame so disabled levels cost no formatting or logger calls
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        info_enabled = logger.isEnabledFor(logging.INFO)
+        if debug_enabled:
+            logger.debug("EyeTracker: left_ratio=%.3f, right_ratio=%.3f", left_ratio, right_ratio)
         
         left_in_range = self.GAZE_MIN_THRESHOLD < left_ratio < self.GAZE_MAX_THRESHOLD
         right_in_range = self.GAZE_MIN_THRESHOLD < right_ratio < self.GAZE_MAX_THRESHOLD
     
         if left_in_range or right_in_range:
             is_looking_away = False
-            logger.debug(
-                "EyeTracker: at least one eye in range (left=%.3f, right=%.3f)",
-                left_ratio,
-                right_ratio,
-            )
+            if debug_enabled:
+                logger.debug(
+                    "EyeTracker: at least one eye in range (left=%.3f, right=%.3f)",
+                    left_ratio,
+                    right_ratio,
+                )
         else:
             is_looking_away = True
-            logger.info(
-                "EyeTracker: both eyes out of range (left=%.3f, right=%.3f)",
-                left_ratio,
-                right_ratio,
-            )
+            if info_enabled:
+                logger.info(
+                    "EyeTracker: both eyes out of range (left=%.3f, right=%.3f)",
+                    left_ratio,
+                    right_ratio,
+                )
         if is_looking_away:
             self.consecutive_look_away_count += 1
-            logger.info(
-                "EyeTracker: look-away detected (count=%d/%d)",
-                self.consecutive_look_away_count,
-                self.CONSECUTIVE_LOOK_AWAY_FRAMES,
-            )
+            if info_enabled:
+                logger.info(
+                    "EyeTracker: look-away detected (count=%d/%d)",
+                    self.consecutive_look_away_count,
+                    self.CONSECUTIVE_LOOK_AWAY_FRAMES,
+                )
             if self.consecutive_look_away_count >= self.CONSECUTIVE_LOOK_AWAY_FRAMES:
                 message = f"Looking away detected ({self.consecutive_look_away_count} consecutive frames)"
                 logger.info("EyeTracker: confirmed look-away violation")
                 self.consecutive_look_away_count = 0 
                 return True, message
         else:
-            if self.consecutive_look_away_count > 0:
+            if self.consecutive_look_away_count > 0 and debug_enabled:
                 logger.debug("EyeTracker: gaze back on screen. Resetting counter.")
             self.consecutive_look_away_count = 0
 
@@ -153,8 +265,9 @@ class EyeTracker:
         self.consecutive_look_away_count = 0
 
     def release(self) -> None:
-        if self.face_mesh is not None:
-            self.face_mesh.close()
-            self.face_mesh = None
+        with self._lock:
+            if self.face_mesh is not None:
+                self.face_mesh.close()
+                self.face_mesh = None
         logger.debug("EyeTracker: release called, MediaPipe resources released")
 
@@ -1,5 +1,7 @@
 import logging
-from typing import Optional, Tuple
+import os
+import threading
+from typing import NamedTuple, Optional, Tuple
 
 import cv2
 import mediapipe as mp
@@ -8,6 +10,16 @@ import numpy as np
 logger = logging.getLogger(__name__)
 
 
+class FaceResult(NamedTuple):
+    """Detected face box in pixels of the analysed frame; _asdict() gives the API's "face" object."""
+
+    x: int
+    y: int
+    width: int
+    height: int
+    confidence: float
+
+
 class FaceDetector:
     def __init__(self):
         self.mp_face_detection = mp.solutions.face_detection
@@ -15,13 +27,21 @@ class FaceDetector:
             model_selection=0, min_detection_confidence=0.5
         )
         self.mp_drawing = mp.solutions.drawing_utils
+        # MediaPipe graphs are not safe to call from several threads at once
+        self._lock = threading.Lock()
+        # Run detection on every N-th frame of a session; callers repeat that session's last result in between
+        self.frame_stride = max(1, int(os.getenv("FACE_DETECTOR_STRIDE", "1")))
 
-    def detect_face(self, frame: np.ndarray) -> Tuple[bool, Optional[dict]]:
+    def detect_face(self, frame: np.ndarray, is_rgb: bool = False) -> Tuple[bool, Optional[FaceResult]]:
         """
-        Detect face in frame.
+        Detect face in frame (BGR, or RGB when is_rgb=True).
         Returns: (is_face_present, face_data)
         """
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        with self._lock:
+            return self._detect(frame, is_rgb)
+
+    def _detect(self, frame: np.ndarray, is_rgb: bool) -> Tuple[bool, Optional[FaceResult]]:
+        rgb_frame = frame if is_rgb else cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         results = self.face_detection.process(rgb_frame)
 
         if results.detections:
@@ -29,34 +49,34 @@ class FaceDetector:
             bbox = detection.location_data.relative_bounding_box
             h, w, _ = frame.shape
 
-            face_data = {
-                "x": int(bbox.xmin * w),
-                "y": int(bbox.ymin * h),
-                "width": int(bbox.width * w),
-                "height": int(bbox.height * h),
-                "confidence": detection.score[0],
-            }
+            face_data = FaceResult(
+                x=int(bbox.xmin * w),
+                y=int(bbox.ymin * h),
+                width=int(bbox.width * w),
+                height=int(bbox.height * h),
+                confidence=detection.score[0],
+            )
             logger.info(
                 "FaceDetector: face detected (x=%s, y=%s, w=%s, h=%s, confidence=%.2f)",
-                face_data["x"],
-                face_data["y"],
-                face_data["width"],
-                face_data["height"],
-                face_data["confidence"],
+                face_data.x,
+                face_data.y,
+                face_data.width,
+                face_data.height,
+                face_data.confidence,
             )
             return True, face_data
 
         logger.debug("FaceDetector: no face detected in current frame")
         return False, None
 
-    def draw_face_box(self, frame: np.ndarray, face_data: dict) -> np.ndarray:
+    def draw_face_box(self, frame: np.ndarray, face_data: FaceResult) -> np.ndarray:
         """Draw bounding box around detected face."""
         cv2.rectangle(
             frame,
-            (face_data["x"], face_data["y"]),
+            (face_data.x, face_data.y),
             (
-                face_data["x"] + face_data["width"],
-                face_data["y"] + face_data["height"],
+                face_data.x + face_data.width,
+                face_data.y + face_data.height,
             ),
             (0, 255, 0),
             2,
@@ -65,6 +85,7 @@ class FaceDetector:
 
     def release(self):
         """Release resources."""
-        self.face_detection.close()
+        with self._lock:
+            self.face_detection.close()
         logger.debug("FaceDetector resources released")
 
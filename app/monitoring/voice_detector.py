@@ -1,31 +1,112 @@
 import logging
+import math
 import time
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple, Union
 
 import numpy as np
 import webrtcvad
 
+try:
+    import scipy.fft as _fft
+except ImportError:  # scipy is optional; NumPy's FFT gives the same spectrum
+    _fft = np.fft
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional; VoiceDetector then uses the NumPy feature path
+    njit = None
+
 logger = logging.getLogger(__name__)
 
 
+def _spectral_stats(
+    spectrum: np.ndarray, freqs_khz: np.ndarray, cumulative: np.ndarray
+) -> Tuple[float, float, float, float]:
+    """log-energy, centroid (kHz), 85% rolloff (kHz) and flatness of an rfft spectrum in one pass.
+
+    cumulative is scratch space of at least spectrum.size elements.
+    """
+    n_bins = spectrum.size
+    total = 0.0
+    weighted = 0.0
+    energy = 0.0
+    log_sum = 0.0
+    for k in range(n_bins):
+        m = abs(spectrum[k]) + 1e-8
+        total += m
+        cumulative[k] = total
+        weighted += freqs_khz[k] * m
+        energy += m * m
+        log_sum += math.log(m)
+
+    # First bin where the running magnitude sum reaches 85% of the total
+    rolloff_idx = min(np.searchsorted(cumulative[:n_bins], 0.85 * total), n_bins - 1)
+
+    centroid = weighted / (total + 1e-8)
+    spectral_flatness = math.exp(log_sum / n_bins) / (total / n_bins + 1e-8)
+    log_energy = math.log10(energy + 1e-8)
+    return log_energy, centroid, freqs_khz[rolloff_idx], spectral_flatness
+
+
+def _spectral_stats_batch(
+    spectra: np.ndarray, freqs_khz: np.ndarray, cumulative: np.ndarray, out: np.ndarray
+) -> None:
+    """Row-wise _spectral_stats over an (n_frames, n_bins) spectrum matrix into out[:, :4]."""
+    for row in range(spectra.shape[0]):
+        log_energy, centroid, rolloff, spectral_flatness = _spectral_stats(spectra[row], freqs_khz, cumulative)
+        out[row, 0] = log_energy
+        out[row, 1] = centroid
+        out[row, 2] = rolloff
+        out[row, 3] = spectral_flatness
+
+
+if njit is not None:
+    _spectral_stats = njit(cache=True, fastmath=True, boundscheck=False)(_spectral_stats)
+    _spectral_stats_batch = njit(cache=True, fastmath=True, boundscheck=False)(_spectral_stats_batch)
+
+
 class VoiceDetector:
     """
     Voice detector that combines WebRTC VAD with a lightweight spectral classifier
     to better distinguish human speech from other sounds (music, background noise).
     """
 
+    # Slack on the time-domain energy gate; its estimate differs from the spectral one by ~1e-6 (log10)
+    _GATE_TOLERANCE = 1e-4
+
     def __init__(self):
         self.vad = webrtcvad.Vad(2)  # Aggressiveness mode: 0-3, 3 is most aggressive
         self.sample_rate = 16000
         self.frame_duration_ms = 30
         self.frame_size = int(self.sample_rate * self.frame_duration_ms / 1000)
 
+        # Spectral setup for the fixed frame size, built once instead of on every frame
+        self._n_fft = self._fft_size(self.frame_size)
+        # Hann window with the int16 -> [-1, 1] scale folded in (power-of-two scale, so bit-identical)
+        self._window_scaled = np.hanning(self.frame_size) / 32768.0
+        self._freqs_khz = np.fft.rfftfreq(self._n_fft, d=1.0 / self.sample_rate) / 1000.0
+        # Zero-padded FFT input, one row per frame, reused across chunks (grown on demand);
+        # only the first frame_size columns are ever written
+        self._fft_in = np.zeros((1, self._n_fft), dtype=np.float64)
+        self._cumulative = np.empty(self._freqs_khz.size, dtype=np.float64)
+        if njit is not None:
+            # Compile (or load the cached) kernel now; the first call otherwise stalls a request
+            _spectral_stats_batch(
+                _fft.rfft(self._fft_in, axis=1),
+                self._freqs_khz,
+                self._cumulative,
+                np.empty((1, 5), dtype=np.float32),
+            )
+
         # Lightweight logistic model parameters (hand-tuned using sample data)
         # Features: [log_energy, spectral_centroid_khz, spectral_rolloff_khz, spectral_flatness, zcr]
         self.feature_mean = np.array([2.1, 1.7, 3.2, 0.25, 0.12], dtype=np.float32)
         self.feature_std = np.array([0.9, 0.6, 0.9, 0.15, 0.08], dtype=np.float32)
         self.feature_weights = np.array([1.2, -0.8, -0.4, -1.1, -0.6], dtype=np.float32)
         self.feature_bias = 0.35
+        # Normalization folded into the model: w·((x - mean) / std) + b == (w / std)·x + (b - (w / std)·mean)
+        self._w_scaled = (self.feature_weights / (self.feature_std + 1e-6)).astype(np.float32)
+        self._b_scaled = float(self.feature_bias - np.dot(self._w_scaled, self.feature_mean))
         self.human_threshold = 0.72  # probability threshold tuned for fewer false positives
         self.energy_bounds: Tuple[float, float] = (-1.5, 5.0)  # acceptable log-energy range
         self.max_spectral_flatness = 0.3
@@ -60,21 +141,30 @@ class VoiceDetector:
         Process audio frame from external source (e.g., from frontend).
         Returns True if human speech is detected.
         """
+        # Monotonic clock, read once per chunk: speech timing is elapsed time, immune to wall-clock jumps
+        now = time.monotonic()
         try:
             if len(audio_data) < self.frame_size * 2:  # 2 bytes per sample
                 # Not enough data for a full frame; rely on existing state
-                return self._recent_speech_detected()
+                return self._recent_speech_detected(now)
 
-            # Process chunk frame-by-frame (~30ms per frame)
+            # Classify every ~30ms frame of the chunk, then replay the decisions in order
             frame_bytes = self.frame_size * 2
             speech_confirmed = False
             frames_processed = 0
 
-            for offset in range(0, len(audio_data) - frame_bytes + 1, frame_bytes):
-                chunk = audio_data[offset : offset + frame_bytes]
+            # Decode every whole frame at once; each row is a zero-copy view
+            n_frames = len(audio_data) // frame_bytes
+            all_samples = np.frombuffer(
+                audio_data, dtype=np.int16, count=n_frames * self.frame_size
+            ).reshape(n_frames, self.frame_size)
+
+            is_human, probabilities = self._classify_frames(audio_data, all_samples)
+
+            for i in range(n_frames):
                 frames_processed += 1
 
-                if self._evaluate_frame(chunk):
+                if self._evaluate_frame(bool(is_human[i]), float(probabilities[i])):
                     if self._consecutive_human_frames >= self.required_consecutive_frames:
                         speech_confirmed = True
                         break
@@ -84,23 +174,22 @@ class VoiceDetector:
                     self.speech_duration = 0.0
 
             if speech_confirmed:
-                now = time.time()
                 self.last_speech_time = now
                 self.speech_detected = True
                 self.speech_duration += frames_processed * (self.frame_duration_ms / 1000.0)
                 return True
 
-            return self._recent_speech_detected()
+            return self._recent_speech_detected(now)
         except Exception as e:
             logger.exception("VoiceDetector: error processing audio frame: %s", e)
             return False
 
-    def _recent_speech_detected(self) -> bool:
+    def _recent_speech_detected(self, now: float) -> bool:
         """Return True if speech was detected recently to avoid flicker."""
         if not self.speech_detected or self.last_speech_time is None:
             return False
 
-        if time.time() - self.last_speech_time <= 0.3:
+        if now - self.last_speech_time <= 0.3:
             return True
 
         # Cooldown elapsed; reset state
@@ -112,10 +201,12 @@ class VoiceDetector:
     # ------------------------------------------------------------------
     # Core detection helpers
     # ------------------------------------------------------------------
-    def _evaluate_frame(self, audio_frame: bytes) -> bool:
-        """Evaluate a single frame and update running counters."""
-        is_human = self._is_human_frame(audio_frame)
-        logger.info("VoiceDetector: is_human=%s", is_human)
+    def _evaluate_frame(self, is_human: bool, probability: float) -> bool:
+        """Apply one frame's decision to the running counters."""
+        self.last_human_probability = probability if is_human else 0.0
+        # Runs for every 30 ms frame: keep it out of INFO and skip the logger call when DEBUG is off
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("VoiceDetector: is_human=%s", is_human)
         if is_human:
             self._consecutive_human_frames += 1
             self._consecutive_non_human_frames = 0
@@ -124,80 +215,169 @@ class VoiceDetector:
             self._consecutive_human_frames = 0
         return is_human
 
-    def _is_human_frame(self, audio_frame: bytes) -> bool:
-        """Combine WebRTC VAD and spectral classifier for one frame."""
-        vad_result = self.vad.is_speech(audio_frame[: self.frame_size * 2], self.sample_rate)
-        if not vad_result:
-            self.last_human_probability = 0.0
-            return False
-
-        samples = np.frombuffer(audio_frame, dtype=np.int16).astype(np.float32)
-        if samples.size == 0:
-            self.last_human_probability = 0.0
-            return False
-
-        features = self._extract_features(samples)
-        probability = self._predict_probability(features)
-
-        log_energy = features[0]
-        spectral_flatness = features[3]
-        centroid = features[1]
-        rolloff = features[2]
-        zcr = features[4]
-
-        conditions = [
-            probability >= self.human_threshold,
-            self.energy_bounds[0] <= log_energy <= self.energy_bounds[1],
-            spectral_flatness <= self.max_spectral_flatness,
-            self.centroid_range_khz[0] <= centroid <= self.centroid_range_khz[1],
-            rolloff <= self.rolloff_max_khz,
-            zcr <= self.max_zcr,
-        ]
-
-        self.last_human_probability = probability if all(conditions) else 0.0
-        logger.debug(
-            "VoiceDetector: features=%s prob=%.3f vad=%s conditions=%s",
-            np.round(features, 3),
-            probability,
-            vad_result,
-            conditions,
+    def _classify_frames(self, audio_data: bytes, frames: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Combine WebRTC VAD and spectral classifier for every row of an (n_frames, frame_size) int16 matrix
+        (audio_data holds the same frames as raw bytes for VAD). Returns per-frame decisions and model
+        probabilities; frames rejected before the model get probability 0.
+        """
+        n_frames = frames.shape[0]
+        is_human = np.zeros(n_frames, dtype=bool)
+        probabilities = np.zeros(n_frames, dtype=np.float64)
+
+        # VAD and the time-domain gate run per frame; the spectral model runs once on the survivors
+        frame_bytes = self.frame_size * 2
+        # VAD reads each frame through a zero-copy view instead of a fresh bytes slice
+        audio_view = memoryview(audio_data)
+        candidates: List[int] = []
+        gate_features: List[Tuple[float, float]] = []
+        for i in range(n_frames):
+            gated = self._prefilter_frame(audio_view[i * frame_bytes : (i + 1) * frame_bytes], frames[i])
+            if gated is not None:
+                candidates.append(i)
+                gate_features.append(gated)
+        if not candidates:
+            return is_human, probabilities
+
+        # The gate already measured log-energy and ZCR for the survivors; the batch reuses them
+        gate_log_energy, gate_zcr = np.array(gate_features).T
+        features = self._extract_features_batch(frames[candidates], gate_log_energy, gate_zcr)
+        candidate_probabilities = self._predict_probability(features)
+        log_energy, centroid, rolloff, spectral_flatness, zcr = features.T
+
+        accepted = (
+            (candidate_probabilities >= self.human_threshold)
+            & (log_energy >= self.energy_bounds[0])
+            & (log_energy <= self.energy_bounds[1])
+            & (zcr <= self.max_zcr)
+            & (centroid >= self.centroid_range_khz[0])
+            & (centroid <= self.centroid_range_khz[1])
+            & (rolloff <= self.rolloff_max_khz)
+            & (spectral_flatness <= self.max_spectral_flatness)
         )
-        return all(conditions)
-
-    def _extract_features(self, samples: np.ndarray) -> np.ndarray:
-        """Extract lightweight spectral features for classification."""
-        # Normalize to [-1, 1]
-        samples = samples / 32768.0
-        samples = np.clip(samples, -1.0, 1.0)
-
-        window = np.hanning(samples.size)
-        windowed = samples * window
-
-        n_fft = int(2 ** np.ceil(np.log2(max(256, windowed.size))))
-        spectrum = np.fft.rfft(windowed, n=n_fft)
-        magnitude = np.abs(spectrum) + 1e-8
-        energy = np.sum(magnitude ** 2)
-
-        freqs = np.fft.rfftfreq(n_fft, d=1.0 / self.sample_rate)
-        weighted_sum = np.sum(freqs * magnitude)
-        centroid = (weighted_sum / (np.sum(magnitude) + 1e-8)) / 1000.0  # kHz
-
-        cumulative = np.cumsum(magnitude)
-        rolloff_idx = np.searchsorted(cumulative, 0.85 * cumulative[-1]) if cumulative[-1] > 0 else 0
-        rolloff = (freqs[min(rolloff_idx, freqs.size - 1)] if freqs.size else 0.0) / 1000.0  # kHz
-
-        spectral_flatness = np.exp(np.mean(np.log(magnitude))) / (np.mean(magnitude) + 1e-8)
-        zcr = np.mean(np.abs(np.diff(np.sign(samples)))) * 0.5
-
-        log_energy = np.log10(energy + 1e-8)
-        return np.array([log_energy, centroid, rolloff, spectral_flatness, zcr], dtype=np.float32)
-
-    def _predict_probability(self, features: np.ndarray) -> float:
-        """Apply small logistic model."""
-        normalized = (features - self.feature_mean) / (self.feature_std + 1e-6)
-        score = float(np.dot(self.feature_weights, normalized) + self.feature_bias)
-        probability = 1.0 / (1.0 + np.exp(-score))
-        return probability
+        is_human[candidates] = accepted
+        probabilities[candidates] = candidate_probabilities
+
+        if logger.isEnabledFor(logging.DEBUG):
+            for row, i in enumerate(candidates):
+                logger.debug(
+                    "VoiceDetector: frame=%d features=%s prob=%.3f is_human=%s",
+                    i,
+                    np.round(features[row], 3),
+                    candidate_probabilities[row],
+                    accepted[row],
+                )
+        return is_human, probabilities
+
+    def _prefilter_frame(self, audio_frame: memoryview, samples: np.ndarray) -> Optional[Tuple[float, float]]:
+        """
+        WebRTC VAD plus the time-domain energy/ZCR gate for one frame.
+        Returns (log_energy, zcr) for frames that pass, None for rejected ones.
+        """
+        if not self.vad.is_speech(audio_frame, self.sample_rate):
+            return None
+
+        # Cheap time-domain rejection: energy and ZCR bounds are part of the final decision,
+        # so frames failing them can skip the FFT without changing the outcome
+        gate_log_energy, gate_zcr = self._time_domain_features(samples)
+        if (
+            not (
+                self.energy_bounds[0] - self._GATE_TOLERANCE
+                <= gate_log_energy
+                <= self.energy_bounds[1] + self._GATE_TOLERANCE
+            )
+            or gate_zcr > self.max_zcr
+        ):
+            return None
+        return gate_log_energy, gate_zcr
+
+    def _time_domain_features(self, samples: np.ndarray) -> Tuple[float, float]:
+        """Log-energy and ZCR of one int16 frame without an FFT, on the same scale as _extract_features_batch."""
+        # Rows of the chunk's frame matrix always hold exactly frame_size samples
+        assert samples.size == self.frame_size, "expected one frame_size frame"
+        windowed = samples * self._window_scaled
+        n_fft = self._n_fft
+
+        # Parseval: the one-sided rfft holds half the full-spectrum energy (n_fft * sum(x^2))
+        # plus half of the DC and Nyquist bins, which are plain and alternating sums
+        dc = windowed.sum()
+        nyquist = windowed[::2].sum() - windowed[1::2].sum()
+        energy = 0.5 * (n_fft * np.dot(windowed, windowed) + dc * dc + nyquist * nyquist)
+        log_energy = math.log10(energy + 1e-8)
+
+        return log_energy, self._zero_crossing_rate(samples)
+
+    def _extract_features_batch(
+        self,
+        frames: np.ndarray,
+        precomputed_log_energy: Optional[np.ndarray] = None,
+        precomputed_zcr: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Spectral features for every row of an (n_frames, frame_size) int16 matrix, as (n_frames, 5) float32.
+        Per-frame log-energy / ZCR already measured by the time-domain gate can be passed in to skip
+        recomputing them.
+        """
+        n_frames = frames.shape[0]
+        if self._fft_in.shape[0] < n_frames:
+            self._fft_in = np.zeros((n_frames, self._n_fft), dtype=np.float64)
+        fft_in = self._fft_in[:n_frames]
+
+        # Scale to [-1, 1] and window straight into the zero-padded rows (int16 needs no clipping),
+        # then transform all frames in one call
+        np.multiply(frames, self._window_scaled, out=fft_in[:, : self.frame_size])
+        spectra = _fft.rfft(fft_in, axis=1)
+
+        features = np.empty((n_frames, 5), dtype=np.float32)
+        if njit is not None:
+            _spectral_stats_batch(spectra, self._freqs_khz, self._cumulative, features)
+        else:
+            # One magnitude matrix; its row-wise cumulative sum also provides the totals
+            magnitude = np.abs(spectra)
+            magnitude += 1e-8
+            cumulative = np.cumsum(magnitude, axis=1)
+            total = cumulative[:, -1]
+            features[:, 1] = (magnitude @ self._freqs_khz) / (total + 1e-8)  # kHz
+
+            # First bin where the running magnitude sum reaches 85% of the total
+            n_bins = magnitude.shape[1]
+            rolloff_idx = np.count_nonzero(cumulative < 0.85 * total[:, None], axis=1)
+            features[:, 2] = self._freqs_khz[np.minimum(rolloff_idx, n_bins - 1)]  # kHz
+
+            if precomputed_log_energy is None:
+                energy = np.einsum("ij,ij->i", magnitude, magnitude)
+                features[:, 0] = np.log10(energy + 1e-8)
+
+            log_mean = np.log(magnitude, out=magnitude).sum(axis=1) / n_bins
+            features[:, 3] = np.exp(log_mean) / (total / n_bins + 1e-8)
+
+        # The kernel's fused energy sum is overwritten here too; both agree to ~1e-6 in log10
+        if precomputed_log_energy is not None:
+            features[:, 0] = precomputed_log_energy
+        features[:, 4] = self._zero_crossing_rate(frames) if precomputed_zcr is None else precomputed_zcr
+        return features
+
+    @staticmethod
+    def _zero_crossing_rate(samples: np.ndarray) -> Union[float, np.ndarray]:
+        """
+        Fraction of adjacent sample pairs whose sign bit flips (zero counts as positive), along the last axis:
+        a float for one frame, one value per row for an (n_frames, frame_size) matrix.
+        """
+        n_samples = samples.shape[-1]
+        if n_samples < 2:
+            return 0.0
+        sign_bits = np.signbit(samples)
+        return np.count_nonzero(sign_bits[..., 1:] != sign_bits[..., :-1], axis=-1) / (n_samples - 1)
+
+    @staticmethod
+    def _fft_size(n_samples: int) -> int:
+        """Zero-padded FFT length: next power of two, at least 256."""
+        return int(2 ** np.ceil(np.log2(max(256, n_samples))))
+
+    def _predict_probability(self, features: np.ndarray) -> np.ndarray:
+        """Apply small logistic model to each row of an (n_frames, 5) feature matrix."""
+        scores = features @ self._w_scaled + self._b_scaled
+        return 1.0 / (1.0 + np.exp(-scores))
 
     # ------------------------------------------------------------------
 
@@ -1,10 +1,13 @@
+import heapq
+import math
 import secrets
 import threading
 import time
-from typing import Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 
 class SessionInfo:
+    # created_at / last_seen are time.monotonic() readings: only used for elapsed-time checks
     def __init__(self, session_id: str, created_at: float, exam_id: Optional[int] = None, student_id: Optional[int] = None):
         self.session_id = session_id
         self.created_at = created_at
@@ -14,24 +17,44 @@ class SessionInfo:
         self.student_id = student_id
 
 
-class SessionManager:
-    def __init__(self, ttl_seconds: int = 60 * 60 * 4):
+class FrameState:
+    """Per-session video state: frames seen (for detector strides) and the last face detection result."""
+
+    def __init__(self):
+        self.frame_count = 0
+        # (decoded frame shape, face_present, face box) from the last frame that ran face detection
+        self.last_face: Optional[Tuple[Any, ...]] = None
+
+    def next_frame_index(self) -> int:
+        index = self.frame_count
+        self.frame_count += 1
+        return index
+
+
+class _SessionShard:
+    """One partition of the session table: its own lock, session map, expiry heap, audio buffers and frame state."""
+
+    def __init__(self, ttl_seconds: int):
         self._sessions: Dict[str, SessionInfo] = {}
+        # Min-heap of (deadline, session_id). Entries are not updated on touch: cleanup re-queues a
+        # popped entry at the session's real deadline, so there is about one entry per session
+        self._expiry: List[Tuple[float, str]] = []
+        # Pending PCM per session, flushed to the voice detector in whole windows
+        self._audio_buf: Dict[str, bytearray] = {}
+        self._frame_state: Dict[str, FrameState] = {}
         self._lock = threading.Lock()
         self._ttl_seconds = ttl_seconds
 
-    def create(self, exam_id: Optional[int] = None, student_id: Optional[int] = None) -> str:
-        session_id = secrets.token_urlsafe(16)
-        now = time.time()
+    def add(self, session_id: str, now: float, exam_id: Optional[int], student_id: Optional[int]) -> None:
         with self._lock:
             self._sessions[session_id] = SessionInfo(session_id, now, exam_id, student_id)
-        return session_id
+            heapq.heappush(self._expiry, (now + self._ttl_seconds, session_id))
 
-    def touch(self, session_id: str) -> Optional[SessionInfo]:
+    def touch(self, session_id: str, now: float) -> Optional[SessionInfo]:
         with self._lock:
             info = self._sessions.get(session_id)
             if info and info.is_active:
-                info.last_seen = time.time()
+                info.last_seen = now
                 return info
         return None
 
@@ -40,23 +63,100 @@ class SessionManager:
             info = self._sessions.get(session_id)
             if not info:
                 return False
-            info.is_active = False
+            if info.is_active:
+                info.is_active = False
+                # Nothing is analysed for a stopped session any more: free its pending audio and frame state now
+                self._audio_buf.pop(session_id, None)
+                self._frame_state.pop(session_id, None)
+                # Stopped sessions are dropped on the next cleanup
+                heapq.heappush(self._expiry, (-math.inf, session_id))
             return True
 
     def get(self, session_id: str) -> Optional[SessionInfo]:
         with self._lock:
             return self._sessions.get(session_id)
 
-    def cleanup(self) -> int:
-        """Remove expired sessions, returns count cleaned."""
-        now = time.time()
+    def frame_state(self, session_id: str) -> FrameState:
+        with self._lock:
+            info = self._sessions.get(session_id)
+            if info is None or not info.is_active:
+                # Unknown or stopped session: a throwaway state, so every frame is fully analysed
+                # and nothing is kept for it
+                return FrameState()
+            return self._frame_state.setdefault(session_id, FrameState())
+
+    def buffer_audio(self, session_id: str, audio_data: bytes, window_bytes: int) -> bytes:
+        """Append PCM to the session buffer; return every complete window (b"" until one is full)."""
+        with self._lock:
+            info = self._sessions.get(session_id)
+            if info is None or not info.is_active:
+                # No buffer for unknown (e.g. ids from before a restart) or stopped sessions, nothing would
+                # free it: analyse the upload as is; the detector ignores a trailing partial frame
+                return audio_data
+            buf = self._audio_buf.setdefault(session_id, bytearray())
+            buf += audio_data
+            ready = len(buf) - len(buf) % window_bytes
+            if not ready:
+                return b""
+            windows = bytes(buf[:ready])
+            del buf[:ready]
+            return windows
+
+    def cleanup(self, now: float) -> int:
         removed = 0
         with self._lock:
-            for sid in list(self._sessions.keys()):
-                info = self._sessions[sid]
-                if (now - info.last_seen) > self._ttl_seconds or not info.is_active:
-                    del self._sessions[sid]
-                    removed += 1
+            # Only sessions whose queued deadline has passed are looked at
+            while self._expiry and self._expiry[0][0] < now:
+                _, sid = heapq.heappop(self._expiry)
+                info = self._sessions.get(sid)
+                if info is None:
+                    continue  # already removed (e.g. stopped, then its original entry came due)
+                deadline = info.last_seen + self._ttl_seconds
+                if info.is_active and deadline >= now:
+                    # Touched since this entry was queued: re-queue at the real deadline
+                    heapq.heappush(self._expiry, (deadline, sid))
+                    continue
+                del self._sessions[sid]
+                self._audio_buf.pop(sid, None)
+                self._frame_state.pop(sid, None)
+                removed += 1
         return removed
 
 
+class SessionManager:
+    # Sessions are spread over independently locked shards so concurrent requests rarely contend
+    _N_SHARDS = 16
+
+    def __init__(self, ttl_seconds: int = 60 * 60 * 4):
+        self._shards = [_SessionShard(ttl_seconds) for _ in range(self._N_SHARDS)]
+
+    def _shard(self, session_id: str) -> _SessionShard:
+        return self._shards[hash(session_id) & (self._N_SHARDS - 1)]
+
+    def create(self, exam_id: Optional[int] = None, student_id: Optional[int] = None) -> str:
+        session_id = secrets.token_urlsafe(16)
+        self._shard(session_id).add(session_id, time.monotonic(), exam_id, student_id)
+        return session_id
+
+    def touch(self, session_id: str) -> Optional[SessionInfo]:
+        return self._shard(session_id).touch(session_id, time.monotonic())
+
+    def stop(self, session_id: str) -> bool:
+        return self._shard(session_id).stop(session_id)
+
+    def get(self, session_id: str) -> Optional[SessionInfo]:
+        return self._shard(session_id).get(session_id)
+
+    def frame_state(self, session_id: str) -> FrameState:
+        """Per-session frame counter and cached face result used by the frame endpoint."""
+        return self._shard(session_id).frame_state(session_id)
+
+    def buffer_audio(self, session_id: str, audio_data: bytes, window_bytes: int) -> bytes:
+        """Append PCM to the session buffer; return every complete window (b"" until one is full)."""
+        return self._shard(session_id).buffer_audio(session_id, audio_data, window_bytes)
+
+    def cleanup(self) -> int:
+        """Remove expired sessions, returns count cleaned."""
+        now = time.monotonic()
+        # One shard locked at a time, so cleanup never blocks the whole manager
+        return sum(shard.cleanup(now) for shard in self._shards)
@@ -0,0 +1,142 @@
+import random
+import types
+
+import pytest
+
+from app import session as session_module
+from app.session import SessionManager
+
+TTL = 100
+
+
+class _Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(session_module, "time", types.SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+@pytest.fixture
+def manager(clock):
+    return SessionManager(ttl_seconds=TTL)
+
+
+def test_idle_session_expires_after_ttl(manager, clock):
+    sid = manager.create(exam_id=1, student_id=2)
+    clock.now += TTL
+    assert manager.cleanup() == 0  # exactly TTL idle is still alive
+    clock.now += 1
+    assert manager.cleanup() == 1
+    assert manager.get(sid) is None
+    assert manager.touch(sid) is None
+
+
+def test_touch_requeues_instead_of_expiring(manager, clock):
+    sid = manager.create(exam_id=1, student_id=2)
+    clock.now += TTL - 10
+    assert manager.touch(sid).student_id == 2
+    clock.now += 20  # past the deadline queued at create, within TTL of the touch
+    assert manager.cleanup() == 0
+    assert manager.get(sid) is not None
+    clock.now += TTL
+    assert manager.cleanup() == 1
+    assert manager.get(sid) is None
+
+
+def test_stopped_session_is_dropped_on_next_cleanup(manager, clock):
+    kept = manager.create()
+    stopped = manager.create()
+    assert manager.stop(stopped)
+    assert manager.stop(stopped)  # stopping twice still reports a known session
+    assert manager.touch(stopped) is None
+    assert manager.get(stopped) is not None  # still readable until cleanup
+    assert manager.cleanup() == 1
+    assert manager.get(stopped) is None
+    assert not manager.stop(stopped)
+    assert manager.get(kept) is not None
+
+    # The deadline queued at create comes due later and is skipped without double counting
+    clock.now += 2 * TTL
+    assert manager.cleanup() == 1
+
+
+def test_cleanup_matches_full_scan(manager, clock):
+    """Heap expiry removes exactly the sessions a scan over all of them would."""
+    rng = random.Random(3)
+    expected = {}  # session_id -> [last_seen, active]
+    for _ in range(5000):
+        op = rng.random()
+        if op < 0.3 or not expected:
+            expected[manager.create()] = [clock.now, True]
+        elif op < 0.6:
+            sid = rng.choice(list(expected))
+            assert (manager.touch(sid) is not None) == expected[sid][1]
+            if expected[sid][1]:
+                expected[sid][0] = clock.now
+        elif op < 0.65:
+            sid = rng.choice(list(expected))
+            assert manager.stop(sid)
+            expected[sid][1] = False
+        elif op < 0.7:
+            due = [s for s, (seen, active) in expected.items() if not active or clock.now - seen > TTL]
+            assert manager.cleanup() == len(due)
+            for sid in due:
+                del expected[sid]
+        if rng.random() < 0.3:
+            clock.now += rng.uniform(0, 20)
+    for sid in expected:
+        assert manager.get(sid) is not None
+
+
+def test_buffer_audio_returns_whole_windows(manager):
+    sid = manager.create()
+    assert manager.buffer_audio(sid, b"a" * 300, 960) == b""
+    assert manager.buffer_audio(sid, b"b" * 700, 960) == b"a" * 300 + b"b" * 660
+    # 40 bytes carried over; 2000 more give two full windows and leave 120 pending
+    assert manager.buffer_audio(sid, b"c" * 2000, 960) == b"b" * 40 + b"c" * 1880
+    assert manager.buffer_audio(sid, b"d" * 840, 960) == b"c" * 120 + b"d" * 840
+
+
+def test_buffer_audio_passes_unknown_sessions_through(manager):
+    # e.g. a client still using an id from before a restart
+    assert manager.buffer_audio("unknown", b"x" * 320, 960) == b"x" * 320
+
+
+def test_buffer_audio_dropped_with_session(manager, clock):
+    sid = manager.create()
+    manager.buffer_audio(sid, b"a" * 100, 960)
+    manager.stop(sid)
+    manager.cleanup()
+    assert manager.buffer_audio(sid, b"b" * 100, 960) == b"b" * 100
+
+
+def test_frame_state_is_per_session(manager):
+    a, b = manager.create(), manager.create()
+    assert [manager.frame_state(a).next_frame_index() for _ in range(3)] == [0, 1, 2]
+    assert manager.frame_state(b).next_frame_index() == 0
+    assert manager.frame_state("unknown").next_frame_index() == 0
+    assert manager.frame_state("unknown").next_frame_index() == 0
+
+
+def test_stop_frees_pending_audio_and_frame_state(manager):
+    sid = manager.create()
+    assert manager.buffer_audio(sid, b"a" * 100, 960) == b""
+    manager.frame_state(sid).next_frame_index()
+    manager.stop(sid)
+    shard = manager._shard(sid)
+    assert sid not in shard._audio_buf
+    assert sid not in shard._frame_state
+
+    # A stopped session keeps nothing: uploads are analysed as is and frame state is throwaway
+    assert manager.buffer_audio(sid, b"b" * 100, 960) == b"b" * 100
+    assert manager.frame_state(sid).next_frame_index() == 0
+    assert sid not in shard._audio_buf
+    assert sid not in shard._frame_state
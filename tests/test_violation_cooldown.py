@@ -0,0 +1,146 @@
+import asyncio
+import types
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.models.schemas import ViolationType
+
+KEY = (1, 2, ViolationType.VOICE)
+
+
+class _Clock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+class _SpeakingVoiceDetector:
+    """Stands in for VoiceDetector: every audio window counts as speech."""
+
+    frame_size = 480
+
+    def process_audio_frame(self, audio_data: bytes) -> bool:
+        return True
+
+
+class _Response:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        self.text = "ok" if status_code == 200 else "error"
+
+
+class _Backend:
+    """Stands in for the pooled httpx client; each post waits for the test to release it."""
+
+    def __init__(self, status_code: int = 200, fail: bool = False):
+        self.status_code = status_code
+        self.fail = fail
+        self.release = asyncio.Event()
+
+    async def post(self, url, json):
+        await self.release.wait()
+        if self.fail:
+            raise RuntimeError("backend timed out")
+        return _Response(self.status_code)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(main, "time", types.SimpleNamespace(time=clock.time))
+    monkeypatch.setattr(main, "_last_violation_sent", {})
+    return clock
+
+
+def _send(claimed_at: float):
+    return main.send_violation_to_backend(
+        exam_id=1,
+        student_id=2,
+        violation_type=ViolationType.VOICE,
+        message="Human speech detected",
+        session_id="session",
+        claimed_at=claimed_at,
+    )
+
+
+def test_duplicate_detection_within_cooldown_spawns_no_send(clock, monkeypatch):
+    spawned = []
+
+    def record(send):
+        spawned.append(send)
+        send.close()  # never run against a backend
+
+    monkeypatch.setattr(main, "voice_detector", _SpeakingVoiceDetector())
+    monkeypatch.setattr(main, "_spawn_violation_send", record)
+    session_id = main.session_manager.create(exam_id=1, student_id=2)
+    window = b"\0" * (480 * 2 * main.AUDIO_WINDOW_FRAMES)
+
+    def upload():
+        response = client.post(
+            "/api/anti-cheat/audio",
+            headers={"X-Session-Id": session_id},
+            files={"file": ("chunk", window, "application/octet-stream")},
+        )
+        assert response.status_code == 200
+        assert response.json()["alerts"] == ["speech_detected"]
+
+    client = TestClient(main.app)  # no lifespan: detectors are stubbed above
+    upload()
+    clock.now += main.VIOLATION_COOLDOWN_SECONDS - 1
+    upload()
+    assert len(spawned) == 1
+
+    clock.now += 1
+    upload()
+    assert len(spawned) == 2
+
+
+def test_failed_send_releases_its_claim(clock, monkeypatch):
+    backend = _Backend(fail=True)
+    backend.release.set()
+    monkeypatch.setattr(main.app.state, "http", backend, raising=False)
+
+    claimed_at = main.should_send_violation(*KEY)
+    assert claimed_at is not None
+    assert main.should_send_violation(*KEY) is None
+    asyncio.run(_send(claimed_at))
+    assert KEY not in main._last_violation_sent
+    assert main.should_send_violation(*KEY) is not None
+
+
+def test_successful_send_keeps_its_claim(clock, monkeypatch):
+    backend = _Backend(status_code=200)
+    backend.release.set()
+    monkeypatch.setattr(main.app.state, "http", backend, raising=False)
+
+    claimed_at = main.should_send_violation(*KEY)
+    asyncio.run(_send(claimed_at))
+    assert main._last_violation_sent[KEY] == claimed_at
+
+
+@pytest.mark.parametrize("fail", [True, False], ids=["exception", "http-error"])
+def test_late_failure_keeps_newer_claim(clock, monkeypatch, fail):
+    async def scenario():
+        backend = _Backend(status_code=500, fail=fail)
+        monkeypatch.setattr(main.app.state, "http", backend, raising=False)
+
+        first_claim = main.should_send_violation(*KEY)
+        slow_send = asyncio.create_task(_send(first_claim))
+        await asyncio.sleep(0)  # the send is now waiting on the backend
+
+        # The cooldown runs out while the first send is still in flight; a new detection claims the key
+        clock.now += main.VIOLATION_COOLDOWN_SECONDS
+        newer_claim = main.should_send_violation(*KEY)
+        assert newer_claim is not None and newer_claim != first_claim
+
+        backend.release.set()
+        await slow_send
+        return newer_claim
+
+    newer_claim = asyncio.run(scenario())
+    assert main._last_violation_sent[KEY] == newer_claim
+    assert main.should_send_violation(*KEY) is None
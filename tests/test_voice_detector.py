@@ -0,0 +1,128 @@
+import numpy as np
+import pytest
+
+from app.monitoring import voice_detector as vd_module
+from app.monitoring.voice_detector import VoiceDetector
+
+SAMPLE_RATE = 16000
+FRAME_SIZE = 480
+
+
+class _AlwaysSpeech:
+    """Stands in for webrtcvad so every frame reaches the gate and the spectral model."""
+
+    def is_speech(self, frame, sample_rate):
+        return True
+
+
+def _synthetic_frames(n_frames: int = 400, seed: int = 5) -> np.ndarray:
+    """Noise, tones, harmonic stacks, sparse clicks and full-scale noise at random levels."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(FRAME_SIZE) / SAMPLE_RATE
+    frames = []
+    for i in range(n_frames):
+        kind = i % 5
+        if kind == 0:
+            x = rng.normal(0, 10 ** rng.uniform(0, 4), FRAME_SIZE)
+        elif kind == 1:
+            x = 10 ** rng.uniform(1, 4) * np.sin(2 * np.pi * rng.uniform(80, 3000) * t + rng.uniform(0, 6))
+        elif kind == 2:
+            f0 = rng.uniform(100, 250)
+            x = sum(10 ** rng.uniform(1, 3.5) / k * np.sin(2 * np.pi * f0 * k * t) for k in range(1, 6))
+        elif kind == 3:
+            x = np.zeros(FRAME_SIZE)
+            x[rng.integers(0, FRAME_SIZE, 5)] = rng.integers(-3000, 3000, 5)
+        else:
+            x = rng.integers(-32768, 32767, FRAME_SIZE)
+        frames.append(np.clip(x, -32768, 32767).astype(np.int16))
+    return np.array(frames)
+
+
+def _reference_features(frame: np.ndarray) -> np.ndarray:
+    """Straightforward per-frame features, as computed before the optimized pipeline (sign-bit ZCR)."""
+    samples = frame / 32768.0
+    spectrum = np.fft.rfft(samples * np.hanning(samples.size), n=512)
+    magnitude = np.abs(spectrum) + 1e-8
+    freqs = np.fft.rfftfreq(512, d=1.0 / SAMPLE_RATE)
+
+    log_energy = np.log10(np.sum(magnitude**2) + 1e-8)
+    centroid = np.sum(freqs * magnitude) / (np.sum(magnitude) + 1e-8) / 1000.0
+    cumulative = np.cumsum(magnitude)
+    rolloff = freqs[min(np.searchsorted(cumulative, 0.85 * cumulative[-1]), freqs.size - 1)] / 1000.0
+    flatness = np.exp(np.mean(np.log(magnitude))) / (np.mean(magnitude) + 1e-8)
+    sign_bits = np.signbit(frame)
+    zcr = np.count_nonzero(sign_bits[1:] != sign_bits[:-1]) / (frame.size - 1)
+    return np.array([log_energy, centroid, rolloff, flatness, zcr])
+
+
+def _reference_decision(detector: VoiceDetector, features: np.ndarray) -> bool:
+    log_energy, centroid, rolloff, flatness, zcr = features
+    normalized = (features - detector.feature_mean) / (detector.feature_std + 1e-6)
+    probability = 1.0 / (1.0 + np.exp(-(np.dot(detector.feature_weights, normalized) + detector.feature_bias)))
+    return bool(
+        probability >= detector.human_threshold
+        and detector.energy_bounds[0] <= log_energy <= detector.energy_bounds[1]
+        and flatness <= detector.max_spectral_flatness
+        and detector.centroid_range_khz[0] <= centroid <= detector.centroid_range_khz[1]
+        and rolloff <= detector.rolloff_max_khz
+        and zcr <= detector.max_zcr
+    )
+
+
+@pytest.fixture(params=["default", "numpy-features", "numpy-fft"])
+def detector(request, monkeypatch):
+    """VoiceDetector on each backend: numba/scipy when installed, NumPy feature math, NumPy FFT."""
+    if request.param == "numpy-features":
+        monkeypatch.setattr(vd_module, "njit", None)
+    elif request.param == "numpy-fft":
+        monkeypatch.setattr(vd_module, "_fft", np.fft)
+    detector = VoiceDetector()
+    detector.vad = _AlwaysSpeech()
+    return detector
+
+
+def test_gate_energy_matches_spectral_energy(detector):
+    for frame in _synthetic_frames():
+        gate_log_energy, gate_zcr = detector._time_domain_features(frame)
+        reference = _reference_features(frame)
+        # The gate's bounds are widened by _GATE_TOLERANCE; the Parseval estimate must stay inside it
+        assert abs(gate_log_energy - reference[0]) < detector._GATE_TOLERANCE
+        assert gate_zcr == pytest.approx(reference[4])
+
+
+def test_batch_features_match_reference(detector):
+    frames = _synthetic_frames()
+    features = detector._extract_features_batch(frames)
+    reference = np.array([_reference_features(frame) for frame in frames])
+    np.testing.assert_allclose(features, reference, rtol=1e-5, atol=1e-6)
+
+
+def test_chunk_decisions_match_reference(detector):
+    frames = _synthetic_frames()
+    expected = [_reference_decision(detector, _reference_features(frame)) for frame in frames]
+    assert any(expected) and not all(expected)
+
+    decisions = []
+    # 40 chunks of 10 frames, as process_audio_frame hands them to _classify_frames
+    for chunk in frames.reshape(-1, 10, FRAME_SIZE):
+        is_human, probabilities = detector._classify_frames(chunk.tobytes(), chunk)
+        assert np.all(probabilities[~is_human] >= 0.0)
+        decisions.extend(bool(h) for h in is_human)
+    assert decisions == expected
+
+
+def test_process_audio_frame_confirms_and_holds_speech(detector):
+    t = np.arange(FRAME_SIZE * 10) / SAMPLE_RATE
+    voiced = sum(1500 / k * np.sin(2 * np.pi * 150 * k * t) for k in range(1, 8)).astype(np.int16)
+    features = _reference_features(voiced[:FRAME_SIZE])
+    assert _reference_decision(detector, features)
+
+    assert detector.process_audio_frame(voiced.tobytes())
+    assert detector.speech_detected
+
+    # Input shorter than a frame only reports the recent state: held for 0.3 s, then cleared
+    short = np.zeros(FRAME_SIZE // 2, dtype=np.int16).tobytes()
+    assert detector.process_audio_frame(short)
+    detector.last_speech_time -= 1.0
+    assert not detector.process_audio_frame(short)
+    assert not detector.speech_detected